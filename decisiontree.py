@@ -3,8 +3,9 @@
 File: DecisionTree.py
 Author: Ryan Cervantes
 """
-import math
+import numpy as np
 from collections import namedtuple
+from _splits import best_split, best_split_binary, xlog_table
 
 
 class DecisionTree:
@@ -18,11 +19,13 @@ class DecisionTree:
         """
         return true if the current examples are of only one classification
         """
-        for c in classes:
-            v = cls.plurality_value(examples, c)
-            if v == 1:
-                return True
-        return False
+        # one scan, bailing out at the first mismatch, instead of a
+        # full plurality_value rescan per class
+        first = examples[0].classification
+        for dp in examples:
+            if dp.classification != first:
+                return False
+        return True
 
     @classmethod
     def plurality_value(cls, examples, classs):
@@ -45,12 +48,13 @@ class DecisionTree:
     @classmethod
     def H(cls, *probs):
         """
-        Calculates Entropy H(V) given v0 - vk weights of decisions
+        Calculates Entropy H(V) given v0 - vk weights of decisions.
+        Zero weights contribute zero via masking rather than a
+        try/except around the whole sum, so one zero term no longer
+        zeroes out the others (and real errors are not swallowed).
         """
-        try:
-            return -1*sum(map(lambda vk : math.log2(vk)*vk, probs))
-        except ValueError:
-            return 0
+        p = np.asarray(probs, dtype=float)
+        return float(-1*(p * np.log2(p, where=p > 0, out=np.zeros_like(p))).sum())
 
 
     @classmethod
@@ -62,32 +66,55 @@ class DecisionTree:
 
 
     @classmethod
-    def Remainder(cls, examples, A, V, p, n, pos_class_func):
+    def B_vec(cls, q):
         """
-        Will calculate the total entropy remaining for a given set
-        given an attribute A and V
+        Vectorized B() over an array of weights, one per attribute value
         """
-        remainder = 0
-        for d in V: # over all distinct values of A
-            Ek = list(filter(lambda dp: dp[A] == d, examples))
-            pk, nk = cls.pos_neg(Ek, pos_class_func)
-            partial = 0
-            try:
-                partial = (pk + nk)/(p + n) * cls.B(pk/(pk + nk))
-            except ZeroDivisionError:
-                pass
-            remainder += partial
-        return remainder
+        ent = -1*(q * np.log2(q, where=q > 0, out=np.zeros_like(q))
+                  + (1-q) * np.log2(1-q, where=q < 1, out=np.zeros_like(q)))
+        return np.nan_to_num(ent)
 
 
     @classmethod
-    def Gain(cls, examples, A, V, p, n, pos_class_func):
+    def Remainder(cls, X, y, idx, A, n_vals, p, n, xlog=None):
+        """
+        Will calculate the total entropy remaining for the rows idx
+        given an attribute A with n_vals distinct (integer coded) values.
+        Counts every bucket in one pass with bincount instead of
+        re-filtering the example list per value. With an x*log2(x)
+        table each bucket's entropy tk*B(pk/tk) folds to
+        tk*log2(tk) - pk*log2(pk) - nk*log2(nk), all table lookups.
+        """
+        col = X[idx, A]
+        pos = np.bincount(col[y[idx]], minlength=n_vals)
+        tot = np.bincount(col, minlength=n_vals)
+        if xlog is not None:
+            return float((xlog[tot] - xlog[pos] - xlog[tot - pos]).sum()/(p + n))
+        q = np.divide(pos, tot, where=tot > 0, out=np.zeros(n_vals))
+        weights = tot/(p + n)
+        return float((weights * cls.B_vec(q)).sum())
+
+
+    @classmethod
+    def Gain(cls, X, y, idx, A, n_vals, p, n, xlog=None):
         """
         Calculates the information gain of the given attribute A
-        that has V distinct values.
+        that has n_vals distinct values.
         """
-        return cls.B(p/(p+n)) - cls.Remainder(examples, A, V, p, n, pos_class_func)
+        if xlog is not None:
+            base = (xlog[p + n] - xlog[p] - xlog[n])/(p + n)
+        else:
+            base = cls.B(p/(p+n))
+        return base - cls.Remainder(X, y, idx, A, n_vals, p, n, xlog)
     
+    @classmethod
+    def class_hist(cls, idx, y_codes, n_classes):
+        """
+        Count how many of the rows idx fall in each class, in one pass
+        """
+        return np.bincount(y_codes[idx], minlength=n_classes)
+
+
     @classmethod
     def pos_neg(cls, examples, classifier):
         pos = sum([1 if classifier(dp) else 0 for dp in examples])
@@ -100,11 +127,18 @@ class DecisionTree:
     def __init__(self, tree=None):
         self.p = 0
         self.n = 0
+        self.X = None
+        self.X_cols = {}
+        self.X_packed = None
+        self._gen_cache = None
+        self.y = None
+        self.y_codes = None
         self.examples = []
         self.classes = [] 
         self.attrs = []
         self._attr_values= {}
         self.classifier = None
+        self._val_idx = {}
         self.tree = tree
     
 
@@ -120,6 +154,9 @@ class DecisionTree:
             attrs.append(spec[0])
         self._attr_values = attr_specifications
         self.attrs = attrs
+        # value -> branch index per attribute, for direct tree walks
+        self._val_idx = {a: {v: i for i, v in enumerate(vals)}
+                         for a, vals in attr_specifications.items()}
 
     
     def define_classes(self, classes):
@@ -131,51 +168,180 @@ class DecisionTree:
 
     def load_examples(self, tuples):
         self.examples.extend(self.create_examples(tuples))
-        self.p, self.n = DecisionTree.pos_neg(self.examples, self.classifier)
+        (self.X, self.y, self.y_codes,
+         self.X_cols, self.X_packed) = self._encode(self.examples)
+        self._gen_cache = None
+        self.p = int(self.y.sum())
+        self.n = len(self.examples) - self.p
+
+    def _encode(self, examples):
+        """
+        Store the examples structure-of-arrays style: one contiguous
+        uint8 array of value codes per attribute (the index of the value
+        in the attribute's domain) collected in a dict, the same codes
+        stacked into a (N, n_attrs) matrix, a boolean vector flagging
+        the positive class and an int32 vector of class codes (the
+        index into self.classes). The namedtuples stay around only as
+        the external API view of an example.
+        """
+        n = len(examples)
+        X, cols, packed = self._encode_attrs(examples)
+        y = np.fromiter(map(self.classifier, examples), dtype=bool, count=n)
+        y_codes = np.fromiter(
+            (self.classes.index(dp.classification) for dp in examples),
+            dtype=np.int32, count=n)
+        return X, y, y_codes, cols, packed
+
+    def _encode_attrs(self, examples):
+        """
+        Integer-code just the attribute values of the examples, one
+        contiguous uint8 column per attribute plus the stacked matrix.
+        Usable for unlabeled examples too. When every attribute is
+        binary (the common case here) the codes are additionally packed
+        one bit per attribute into a single uint64 per example, so a
+        value test is a shift-and-mask on one word instead of a matrix
+        gather.
+        """
+        n = len(examples)
+        cols = {}
+        for i, a in enumerate(self.attrs):
+            code = {v: k for k, v in enumerate(self._attr_values[a])}
+            cols[a] = np.fromiter(
+                (code[dp[i]] for dp in examples), dtype=np.uint8, count=n)
+        X = np.empty((n, len(self.attrs)), dtype=np.uint8)
+        for i, a in enumerate(self.attrs):
+            X[:, i] = cols[a]
+        packed = None
+        if len(self.attrs) <= 64 and all(
+                len(self._attr_values[a]) == 2 for a in self.attrs):
+            packed = np.zeros(n, dtype=np.uint64)
+            for i, a in enumerate(self.attrs):
+                packed |= cols[a].astype(np.uint64) << np.uint64(i)
+        return X, cols, packed
 
 
     def generate(self, examples, depth=-1, avoid=[]):
         def domain(idx):
             return self._attr_values[self.attrs[idx]]
 
-        def _generate(depth, examples, parent_examples, used_attrs):
-            DT = DecisionTree
-            used = list(used_attrs)
+        # reuse the columnar store built by load_examples when possible;
+        # the attribute-major copy and x*log2(x) table are pure
+        # functions of the loaded examples, so memoize them across
+        # generate() calls (Adaboost regenerates once per stump)
+        if examples is self.examples and self.X is not None:
+            X, y, y_codes, packed = self.X, self.y, self.y_codes, self.X_packed
+            if self._gen_cache is None:
+                self._gen_cache = (np.ascontiguousarray(X.T),
+                                   xlog_table(len(examples)))
+            Xcol, xlog = self._gen_cache
+        else:
+            X, y, y_codes, _, packed = self._encode(examples)
+            Xcol = np.ascontiguousarray(X.T)
+            xlog = xlog_table(len(examples))
+
+        # which class codes the positive-class function accepts
+        pos_mask = np.zeros(len(self.classes), dtype=bool)
+        pos_mask[np.unique(y_codes[y])] = True
+
+        dom_sizes = np.fromiter(
+            (len(self._attr_values[a]) for a in self.attrs),
+            dtype=np.int32, count=len(self.attrs))
+        max_dom = int(dom_sizes.max()) if len(self.attrs) else 0
+        # common case in this project: two classes, all-binary attrs
+        fast = len(self.classes) == 2 and packed is not None
+
+        DT = DecisionTree
+        all_rows = np.arange(len(examples))
+        root_hist = DT.class_hist(all_rows, y_codes, len(self.classes))
+        root_p = int(root_hist[pos_mask].sum())
+        root_n = int(root_hist.sum()) - root_p
+        # attributes to avoid arrive as names; fold them into the bitmask
+        avoid_mask = 0
+        for name in avoid:
+            avoid_mask |= 1 << self.attrs.index(name)
+
+        # iterative DECISION-TREE-LEARNING: a work stack of pending
+        # nodes replaces the Python recursion, so there is no per-node
+        # frame/closure cost and no recursion limit on deep trees.
+        # Internal nodes are built as lists (parent first, so a child's
+        # slot exists before the child is popped) and tupled up
+        # children-before-parents once the stack drains.
+        root_box = [None]
+        # (container, slot, depth, idx, hist, parent_hist, p, n, used_mask)
+        stack = [(root_box, 0, depth, all_rows, root_hist, root_hist,
+                  root_p, root_n, avoid_mask)]
+        made = []
+        while stack:
+            (box, slot, depth, idx, hist,
+             parent_hist, p, n, used_mask) = stack.pop()
             # if examples is empty then return the majority of the parent
-            if not examples:
-                return DT.plurality(parent_examples, self.classes)
+            if idx.size == 0:
+                box[slot] = self.classes[parent_hist.argmax()]
+                continue
             # if they're all the same class return that class
-            elif DT.fully_classified(examples, self.classes):
-                return examples[0].classification
+            elif (hist != 0).sum() == 1:
+                box[slot] = self.classes[hist.argmax()]
+                continue
             # if there are no attributes left return majority of everyone
-            elif not set(self.attrs) - set(used):
-                return DT.plurality(examples, self.classes)
+            elif used_mask == (1 << len(self.attrs)) - 1:
+                box[slot] = self.classes[hist.argmax()]
+                continue
             # We can still generate the Tree
+            # A <- argmax-a E attributes( IMPORTANCE(a, examples) )
+            if best_split is not None:
+                if fast:
+                    A, _ = best_split_binary(Xcol, y, idx, used_mask,
+                                             p, n, xlog)
+                else:
+                    A, _ = best_split(Xcol, y, idx, used_mask,
+                                      dom_sizes, max_dom, p, n, xlog)
             else:
-                # A <- argmax-a E attributes( IMPORTANCE(a, examples) )
-                gain = []
-                p, n = DT.pos_neg(parent_examples, self.classifier)
+                gain = np.full(len(self.attrs), -1.0)
                 for a in range(0, len(self.attrs)):
-                    if self.attrs[a] in used:
-                        gain.append(-1)
-                    else:
-                        gain.append(
-                            DT.Gain(examples, a, domain(a),
-                                p, n, self.classifier))
-                A = gain.index(max(gain))
-                used.append(self.attrs[A])
-                children = []
-                for vk in domain(A):
-                    # exs <- {e : e E examples and e.A = vk}
-                    exs = list(filter(lambda dp: dp[A] == vk, examples))
-                    # subtree <- DECISION-TREE-LEARNING(exs, attributes - A, examples)
-                    if depth == 0:
-                        children.append(DT.plurality(examples, self.classes))
-                    else:
-                        children.append(_generate(depth-1, exs, examples, used))
-                branch = tuple([A] + children)
-                return branch
-        self.tree = _generate(depth, examples, examples, avoid)
+                    if not used_mask >> a & 1:
+                        gain[a] = DT.Gain(X, y, idx, a, len(domain(a)),
+                                          p, n, xlog)
+                A = int(np.argmax(gain))
+            used_mask |= 1 << A
+            n_vals = len(domain(A))
+            node = [A] + [None] * n_vals
+            made.append((box, slot))
+            box[slot] = node
+            # the p/n the children will score their splits against,
+            # counted once here instead of once per child
+            my_p = int(hist[pos_mask].sum())
+            my_n = int(hist.sum()) - my_p
+            # bucket the rows by their value of A in one sort instead
+            # of filtering the index array once per value, and build
+            # every bucket's class histogram with a single bincount;
+            # with packed binary attributes the value read is a
+            # branchless shift-and-mask on one word per row
+            if packed is not None:
+                col = (packed[idx] >> np.uint64(A) & np.uint64(1)
+                       ).astype(np.uint8)
+            else:
+                col = Xcol[A][idx]
+            order = np.argsort(col, kind='stable')
+            sorted_idx = idx[order]
+            bounds = np.searchsorted(col[order], np.arange(n_vals + 1))
+            bucket_hists = np.bincount(
+                col.astype(np.int64) * len(self.classes) + y_codes[idx],
+                minlength=n_vals * len(self.classes)
+            ).reshape(n_vals, len(self.classes))
+            for vk in range(n_vals):
+                # exs <- {e : e E examples and e.A = vk}
+                exs = sorted_idx[bounds[vk]:bounds[vk+1]]
+                # subtree <- DECISION-TREE-LEARNING(exs, attributes - A, examples)
+                if depth == 0:
+                    node[1 + vk] = self.classes[hist.argmax()]
+                else:
+                    stack.append((node, 1 + vk, depth - 1, exs,
+                                  bucket_hists[vk], hist,
+                                  my_p, my_n, used_mask))
+        # freeze the list nodes into the tuple encoding, children first
+        for box, slot in reversed(made):
+            box[slot] = tuple(box[slot])
+        self.tree = root_box[0]
         # if it is a fully classified tree off the start, add a special marker
         # that will tell the program to always output that 
         if not isinstance(self.tree, tuple):
@@ -183,58 +349,82 @@ class DecisionTree:
         return self.tree
 
 
-    def classify(self, examples, hypothesis=None):
-        def traversify(node):
-            # if the thing is fully classified, just return the classification
-            if node[0] == None:
-                return {None:node[1]}
-
-            attr = self.attrs[node[0]]
-            n = {"attr": attr}
-            # for each vk where vk in A
-            for i in range(len(self._attr_values[attr])):
-                # if that branch is taken, go to value it points to
-                key = self._attr_values[attr][i]
-                # keys zero indexed but nodes are 1 indexed bc node[0] == attr
-                if isinstance(node[i+1], tuple):
-                    n[key] = traversify(node[i+1])
-                else:
-                    n[key] = node[i+1]
-            return n
-        
-        def use_classifier(subtree, example):
-            # the we have received a fully classified tree with
-            # just a default classification that has form {None:<class>}
-            # just always return <class>
-            if None in subtree:
-                return subtree[None] 
-
-            feature = subtree["attr"]
-            vk = getattr(example, feature)
-            # if it is classification return it
-            if subtree[vk] in self.classes:
-                return subtree[vk]
-            # else we recurse down the tree
+    def _flatten(self, tree):
+        """
+        Flatten a tuple tree into parallel arrays for batch walks:
+        feat[node] is the attribute split on (-1 at a leaf),
+        child[node, vk] the slot reached on value vk and label[node]
+        the class code at a leaf.
+        """
+        max_dom = max(len(v) for v in self._attr_values.values())
+        feat, child, label = [], [], []
+
+        def add(node):
+            slot = len(feat)
+            feat.append(-1)
+            child.append([0] * max_dom)
+            label.append(-1)
+            if not isinstance(node, tuple) or node[0] is None:
+                leaf = node if not isinstance(node, tuple) else node[1]
+                label[slot] = self.classes.index(leaf)
+                return slot
+            feat[slot] = node[0]
+            for vk in range(len(node) - 1):
+                child[slot][vk] = add(node[vk + 1])
+            return slot
+
+        add(tree)
+        return (np.array(feat, dtype=np.int32),
+                np.array(child, dtype=np.int32),
+                np.array(label, dtype=np.int32))
+
+    def _classify_batch(self, X, tree, packed=None):
+        """
+        Walk all rows of X down the tree together: every pass gathers
+        each active row's split value and advances it one level, so the
+        work per level is a few array ops instead of a Python descent
+        per example. With packed binary attributes the gather is a
+        shift-and-mask on each row's word.
+        """
+        feat, child, label = self._flatten(tree)
+        node = np.zeros(X.shape[0], dtype=np.int32)
+        while True:
+            f = feat[node]
+            active = np.nonzero(f >= 0)[0]
+            if active.size == 0:
+                break
+            if packed is not None:
+                v = (packed[active] >> f[active].astype(np.uint64)
+                     & np.uint64(1)).astype(np.int32)
             else:
-                return use_classifier(
-                        subtree[vk],
-                        example)
+                v = X[active, f[active]]
+            node[active] = child[node[active], v]
+        return [self.classes[c] for c in label[node]]
 
+    def classify(self, examples, hypothesis=None):
+        def use_classifier(node, example):
+            # walk the tuple tree directly; a leaf is a bare
+            # classification and (None, <class>) marks a tree that was
+            # fully classified off the start
+            while isinstance(node, tuple):
+                if node[0] == None:
+                    return node[1]
+                attr = self.attrs[node[0]]
+                # branches sit 1-indexed after the attr, in domain order
+                node = node[1 + self._val_idx[attr][getattr(example, attr)]]
+            return node
 
         # allow use of other hypothesis other than the instance
         # because implementation is dumb, TODO make everything class stuff
-        classifier = None
-        if hypothesis == None:
-            classifier = traversify(self.tree)
-        else:
-            classifier = traversify(hypothesis)
+        tree = self.tree if hypothesis == None else hypothesis
 
-        # allow one example to be classified or many in bulk
+        # allow one example to be classified or many in bulk;
+        # bulk goes through the vectorized tree walk
         if isinstance(examples, list):
-            return [use_classifier(classifier, example)
-                    for example in examples]
+            X, _, packed = self._encode_attrs(examples)
+            return self._classify_batch(X, tree, packed)
         else:
-            return use_classifier(classifier, examples)
+            return use_classifier(tree, examples)
 
 
     def print(self):
@@ -256,9 +446,10 @@ class DecisionTree:
 
 if __name__ == '__main__':
     import sys
-    training_set = []
-    with open(sys.argv[1], "r") as data:
-        training_set = [tuple(dp.strip(" \n").split(" ")) for dp in [l for l in data]]
+    # one C-level parse of the whole file instead of a strip/split
+    # per line; rows come back as a (N, n_attrs+1) string matrix
+    data = np.genfromtxt(sys.argv[1], dtype='U8')
+    training_set = list(map(tuple, data))
 
     Tree = DecisionTree()
     Tree.define_positive_class(lambda dp: dp.classification in ('A'))
@@ -275,4 +466,4 @@ if __name__ == '__main__':
             ('attr8', 'True', 'False')])
     Tree.load_examples(training_set)
     Tree.generate(Tree.examples)
-    Tree.print_tree()
+    Tree.print()